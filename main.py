@@ -1,5 +1,7 @@
+import os
 import time
 import sys
+import socket
 import logging
 from datetime import datetime, timedelta
 
@@ -10,8 +12,12 @@ from src import email_functions as email_func
 from src import saildoc_functions as saildoc_func
 from src import inreach_functions as inreach_func
 from src import mistralchat_functions as mistral_func
+from src import configs
+from src.job_store import Job, JobStore, SQLiteJobStore
+from src.worker_functions import JobLease, JobSendGuard, SaildocsExchange
 
 POLL_INTERVAL = 60  # seconds
+WORKER_IDLE_SLEEP = 5  # seconds between claim attempts when the queue is empty
 
 def setup_logging():
     logging.basicConfig(
@@ -24,9 +30,9 @@ def initialize_services():
     processed_ids = email_func.load_processed_message_ids()
     return auth_service, processed_ids
 
-def handle_grib_message(msg_id: str, msg_text: str, garmin_reply_url: str, auth_service) -> None:
+def handle_grib_message(msg_id: str, msg_text: str, garmin_reply_url: str, auth_service, exchange=None) -> None:
     logging.info("InReach: GRIB file request received.")
-    grib_result = email_func.request_and_process_saildocs_grib(msg_id, auth_service)
+    grib_result = email_func.request_and_process_saildocs_grib(msg_id, auth_service, exchange)
     if grib_result is not None:
         grib_path, _ = grib_result
         if grib_path:
@@ -97,9 +103,83 @@ def poll_messages(auth_service, processed_ids):
             logging.exception("Error during message processing loop: %s", exc)
         time.sleep(POLL_INTERVAL)
 
+def initialize_job_store() -> JobStore:
+    store = SQLiteJobStore(configs.JOB_STORE_PATH, max_attempts=configs.JOB_MAX_ATTEMPTS)
+    # Carry over messages already answered by a single-process deployment.
+    store.mark_done(email_func.load_processed_message_ids())
+    return store
+
+def enqueue_new_messages(auth_service, store: JobStore) -> int:
+    queued = 0
+    for msg_id, msg_text, garmin_reply_url, received_at, sender_key in email_func.list_new_inreach_messages(auth_service, store.has_job):
+        if msg_text is None:
+            store.mark_failed(msg_id, "no message text")
+            continue
+        if store.enqueue_job(msg_id, sender_key, msg_text, garmin_reply_url, received_at):
+            queued += 1
+    return queued
+
+def run_job(job: Job, auth_service, store: JobStore, worker_id: str) -> None:
+    logging.info("Worker %s: processing message %s (attempt %d).", worker_id, job.msg_id, job.attempts)
+    with JobLease(store, job, worker_id) as lease:
+        inreach_func.set_send_guard(JobSendGuard(lease))
+        try:
+            if job.outbox is not None:
+                # An earlier attempt already produced the reply; finish sending it.
+                inreach_func.send_messages_to_inreach(job.reply_url, job.outbox)
+            elif job.msg_text.strip().lower().startswith("mistral"):
+                handle_mistral_message(job.msg_text, job.reply_url)
+            else:
+                handle_grib_message(job.msg_id, job.msg_text, job.reply_url, auth_service, SaildocsExchange(lease))
+        except Exception as exc:
+            logging.exception("Worker %s: job %s failed: %s", worker_id, job.msg_id, exc)
+            store.release_job(job.msg_id, worker_id, repr(exc))
+        else:
+            if lease.lost.is_set():
+                store.release_job(job.msg_id, worker_id, "lease lost")
+            else:
+                store.complete_job(job.msg_id, worker_id)
+        finally:
+            inreach_func.set_send_guard(None)
+
+def run_worker(auth_service, store: JobStore) -> None:
+    """
+    Multi-worker loop. Any number of these may share one mailbox and job store:
+    one worker at a time polls Gmail (at most once per POLL_INTERVAL across all
+    workers), every worker claims leased jobs, Saildocs requests go out one at a
+    time and Garmin sends share one rate.
+    """
+    if configs.JOB_HEARTBEAT_SECONDS >= configs.JOB_LEASE_SECONDS:
+        raise ValueError(
+            f"JOB_HEARTBEAT_SECONDS ({configs.JOB_HEARTBEAT_SECONDS}) must be less than "
+            f"JOB_LEASE_SECONDS ({configs.JOB_LEASE_SECONDS})."
+        )
+    worker_id = configs.WORKER_ID or f"{socket.gethostname()}:{os.getpid()}"
+    logging.info("Worker %s started with job store %s.", worker_id, configs.JOB_STORE_PATH)
+    while True:
+        try:
+            if store.try_acquire_lock("gmail_poll", worker_id, POLL_INTERVAL):
+                logging.info("Checking for new InReach messages...")
+                queued = enqueue_new_messages(auth_service, store)
+                if queued:
+                    logging.info("Queued %d new InReach message(s).", queued)
+                # Keep the single-process mode's file current so switching back is safe.
+                email_func.save_processed_message_ids(store.finished_message_ids())
+            job = store.claim_job(worker_id, configs.JOB_LEASE_SECONDS)
+            if job is None:
+                time.sleep(WORKER_IDLE_SLEEP)
+                continue
+            run_job(job, auth_service, store, worker_id)
+        except Exception as exc:
+            logging.exception("Error during worker loop: %s", exc)
+            time.sleep(WORKER_IDLE_SLEEP)
+
 def main():
     setup_logging()
     try:
+        if configs.WORKER_MODE:
+            run_worker(email_func.gmail_authenticate(), initialize_job_store())
+            return
         auth_service, processed_ids = initialize_services()
         poll_messages(auth_service, processed_ids)
     except KeyboardInterrupt:
@@ -50,6 +50,14 @@ class Config:
     MESSAGE_SPLIT_LENGTH = int(os.environ.get('MESSAGE_SPLIT_LENGTH', 120))
     DELAY_BETWEEN_MESSAGES = int(os.environ.get('DELAY_BETWEEN_MESSAGES', 5))
 
+    # Multi-worker mode (several processes sharing one mailbox)
+    WORKER_MODE = os.environ.get('WORKER_MODE', '').lower() in ('1', 'true', 'yes')
+    WORKER_ID = os.environ.get('WORKER_ID', '')
+    JOB_STORE_PATH = os.environ.get('JOB_STORE_PATH', './files/jobs.sqlite3')
+    JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', 120))
+    JOB_HEARTBEAT_SECONDS = int(os.environ.get('JOB_HEARTBEAT_SECONDS', 30))
+    JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+
 # Module-level constants for convenience
 TOKEN_PATH = Config.TOKEN_PATH
 CREDENTIALS_PATH = Config.CREDENTIALS_PATH
@@ -74,3 +82,10 @@ MISTRAL_API_URL = Config.MISTRAL_API_URL
 
 MESSAGE_SPLIT_LENGTH = Config.MESSAGE_SPLIT_LENGTH
 DELAY_BETWEEN_MESSAGES = Config.DELAY_BETWEEN_MESSAGES
+
+WORKER_MODE = Config.WORKER_MODE
+WORKER_ID = Config.WORKER_ID
+JOB_STORE_PATH = Config.JOB_STORE_PATH
+JOB_LEASE_SECONDS = Config.JOB_LEASE_SECONDS
+JOB_HEARTBEAT_SECONDS = Config.JOB_HEARTBEAT_SECONDS
+JOB_MAX_ATTEMPTS = Config.JOB_MAX_ATTEMPTS
@@ -3,7 +3,7 @@ import pickle
 import base64
 import logging
 import json
-from typing import Optional, Tuple, Any, List, Set
+from typing import Optional, Tuple, Any, List, Set, Callable
 from email.mime.text import MIMEText
 from base64 import urlsafe_b64decode
 from datetime import datetime
@@ -46,9 +46,11 @@ def load_processed_message_ids() -> Set[str]:
         return set()
 
 def save_processed_message_ids(processed_ids: Set[str]) -> None:
-    """Save processed message IDs to file."""
-    with open(Config.LIST_OF_PROCESSED_MESSAGES_FILE_LOCATION, "w") as f:
+    """Save processed message IDs to file (atomically, so readers never see a partial file)."""
+    tmp_path = Config.LIST_OF_PROCESSED_MESSAGES_FILE_LOCATION + ".tmp"
+    with open(tmp_path, "w") as f:
         json.dump(list(processed_ids), f)
+    os.replace(tmp_path, Config.LIST_OF_PROCESSED_MESSAGES_FILE_LOCATION)
 
 def _extract_subject(msg: dict) -> str:
     """Extract the subject from a Gmail message."""
@@ -78,6 +80,47 @@ def process_new_inreach_message(auth_service: Any, processed_ids: Set[str]) -> O
             return msg_text, msg_id, garmin_reply_url
     return None
 
+def inreach_sender_key(subject: str) -> str:
+    """
+    Identify the sending inReach device from a message subject. Garmin puts the
+    sender's name in the subject ("inReach message from <name>"), while the
+    reply link's extId is a per-message GUID and cannot group messages by device.
+    """
+    return " ".join(subject.lower().split())
+
+def list_new_inreach_messages(
+    auth_service: Any,
+    is_known: Callable[[str], bool]
+) -> List[Tuple[str, Optional[str], Optional[str], float, str]]:
+    """
+    Return (msg_id, msg_text, garmin_reply_url, received_at, sender_key) for every
+    unread InReach message that is_known(msg_id) does not already cover, oldest first.
+    received_at is Gmail's internal date in epoch seconds. msg_text is None when
+    the message has no readable text.
+    """
+    results = auth_service.users().messages().list(userId=GMAIL_USER, q='is:unread').execute()
+    new_messages = []
+    for m in results.get('messages', []):
+        msg_id = m['id']
+        if is_known(msg_id):
+            continue
+        msg = auth_service.users().messages().get(
+            userId=GMAIL_USER, id=msg_id, format='metadata', metadataHeaders=['Subject']
+        ).execute()
+        subject = _extract_subject(msg)
+        if "inreach" not in subject.lower():
+            continue
+        try:
+            msg_text, garmin_reply_url = fetch_message_text_and_url(msg_id, auth_service)
+        except ValueError as e:
+            logger.warning("Could not read InReach message %s: %s", msg_id, e)
+            msg_text, garmin_reply_url = None, None
+        if msg_text is not None and not msg_text.strip():
+            msg_text = None
+        received_at = int(msg.get('internalDate', 0)) / 1000.0
+        new_messages.append((msg_id, msg_text, garmin_reply_url, received_at, inreach_sender_key(subject)))
+    return sorted(new_messages, key=lambda item: item[3])
+
 def fetch_message_text_and_url(message_id: str, auth_service: Any) -> Tuple[str, Optional[str]]:
     """Fetch the message text and Garmin reply URL from a Gmail message."""
     msg = auth_service.users().messages().get(userId=GMAIL_USER, id=message_id).execute()
@@ -118,10 +161,16 @@ def is_inreach_message(message_id: str, auth_service: Any) -> bool:
     subject = _extract_subject(msg)
     return "inreach" in subject.lower()
 
-def request_and_process_saildocs_grib(message_id: str, auth_service: Any) -> Tuple[Optional[str], Optional[str]]:
+def request_and_process_saildocs_grib(
+    message_id: str,
+    auth_service: Any,
+    exchange: Optional[Any] = None
+) -> Tuple[Optional[str], Optional[str]]:
     """
     Processes a GRIB request by validating the request format, sending it to Saildocs if valid,
     and handling the Saildocs response and grib file retrieval.
+    In multi-worker mode exchange (a worker_functions.SaildocsExchange) serializes the
+    Saildocs round trip across workers and records its progress so a retry resumes it.
     """
     msg_text, garmin_reply_url = fetch_message_text_and_url(message_id, auth_service)
     if not saildoc_func.is_valid_grib_request(msg_text):
@@ -129,16 +178,20 @@ def request_and_process_saildocs_grib(message_id: str, auth_service: Any) -> Tup
         inreach_func.send_messages_to_inreach(garmin_reply_url, "Invalid GRIB request format.")
         return None, garmin_reply_url
 
-    _send_gmail_message(auth_service, Config.SAILDOCS_EMAIL_QUERY, "", "send " + msg_text)
-    time_sent = datetime.utcnow()
-    last_response = saildoc_func.wait_for_saildocs_response(auth_service, time_sent)
+    if exchange is None:
+        _send_gmail_message(auth_service, Config.SAILDOCS_EMAIL_QUERY, "", "send " + msg_text)
+        time_sent = datetime.utcnow()
+        last_response = saildoc_func.wait_for_saildocs_response(auth_service, time_sent)
+        response_id = last_response['id'] if last_response else None
+    else:
+        response_id = _exchange_with_saildocs(auth_service, msg_text, exchange)
 
-    if not last_response:
+    if not response_id:
         inreach_func.send_messages_to_inreach(garmin_reply_url, "Saildocs timeout")
         return None, garmin_reply_url
 
     try:
-        grib_path = _get_grib_attachment(auth_service, last_response['id'])
+        grib_path = _get_grib_attachment(auth_service, response_id)
         if not grib_path:
             inreach_func.send_messages_to_inreach(garmin_reply_url, "Could not download grib attachment")
             return None, garmin_reply_url
@@ -149,6 +202,26 @@ def request_and_process_saildocs_grib(message_id: str, auth_service: Any) -> Tup
 
     return grib_path, garmin_reply_url
 
+def _exchange_with_saildocs(auth_service: Any, msg_text: str, exchange: Any) -> Optional[str]:
+    """
+    Send the request to Saildocs and wait for its reply while holding the shared
+    Saildocs lock, so only one request is in flight across all workers and the
+    next unclaimed reply is ours. Skips whatever an earlier attempt already did.
+    """
+    if exchange.reply_id:
+        return exchange.reply_id
+    with exchange.lock():
+        time_sent = exchange.sent_at
+        if time_sent is None:
+            _send_gmail_message(auth_service, Config.SAILDOCS_EMAIL_QUERY, "", "send " + msg_text)
+            time_sent = datetime.utcnow()
+            exchange.record_sent(time_sent)
+        last_response = saildoc_func.wait_for_saildocs_response(auth_service, time_sent, exchange.claim_response)
+        if not last_response:
+            return None
+        exchange.record_reply(last_response['id'])
+        return last_response['id']
+
 def _search_gmail_messages(service: Any, query: str) -> List[dict]:
     """Search for Gmail messages that match a query."""
     page_token = None
@@ -10,6 +10,32 @@ logger = logging.getLogger(__name__)
 
 MAX_MESSAGE_LENGTH = 120
 
+class SendGuard:
+    """
+    Hooks around every part posted by send_messages_to_inreach. Without a guard
+    parts are simply spaced DELAY_BETWEEN_MESSAGES apart; workers install one to
+    share the send rate, resume partly sent messages and stop after losing a job.
+    """
+
+    def begin(self, message: str, total_parts: int) -> int:
+        """Called once per message; returns how many leading parts to skip."""
+        return 0
+
+    def before_part(self, idx: int) -> bool:
+        """Called before posting part idx; return False to stop sending."""
+        return True
+
+    def after_part(self, idx: int) -> None:
+        """Called after part idx was posted."""
+        time.sleep(configs.DELAY_BETWEEN_MESSAGES)
+
+_send_guard: SendGuard = SendGuard()
+
+def set_send_guard(guard: Optional[SendGuard]) -> None:
+    """Install a SendGuard for all later sends (None restores the default)."""
+    global _send_guard
+    _send_guard = guard or SendGuard()
+
 def split_message_for_inreach(gribmessage: str, max_len: int = MAX_MESSAGE_LENGTH) -> List[str]:
     """Split and format a message for InReach, with each part up to max_len characters."""
     chunks = [gribmessage[i:i + max_len] for i in range(0, len(gribmessage), max_len)]
@@ -39,7 +65,13 @@ def send_messages_to_inreach(
     message_parts = split_message_for_inreach(gribmessage, max_len)
 
     responses = []
-    for idx, part in enumerate(message_parts):
+    start = _send_guard.begin(gribmessage, len(message_parts))
+    if start:
+        logger.info(f"Resuming after {start}/{len(message_parts)} parts already sent.")
+    for idx, part in enumerate(message_parts[start:], start=start):
+        if not _send_guard.before_part(idx):
+            logger.warning(f"Stopped sending before part {idx+1}/{len(message_parts)}.")
+            break
         logger.info(
             f"Sending part {idx+1}/{len(message_parts)}: length={len(part)} code=200"
         )
@@ -48,7 +80,7 @@ def send_messages_to_inreach(
             f"Status Code: {getattr(response, 'status_code', None)} length={len(part)} code=200"
         )
         responses.append(response)
-        time.sleep(configs.DELAY_BETWEEN_MESSAGES)
+        _send_guard.after_part(idx)
     return responses
 
 def _post_request_to_inreach(url: str, message_str: str) -> Optional[requests.Response]:
@@ -0,0 +1,396 @@
+import os
+import time
+import sqlite3
+import logging
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+STATUS_PENDING = "pending"
+STATUS_LEASED = "leased"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+# Columns a worker may update while it holds a job's lease, so a retry can
+# resume instead of starting over.
+PROGRESS_FIELDS = ("saildocs_sent_at", "saildocs_reply_id", "outbox", "parts_sent")
+
+
+@dataclass
+class Job:
+    """An InReach message claimed by a worker, with the progress made so far."""
+    msg_id: str
+    device_key: str
+    msg_text: str
+    reply_url: Optional[str]
+    attempts: int
+    saildocs_sent_at: Optional[float] = None
+    saildocs_reply_id: Optional[str] = None
+    outbox: Optional[str] = None
+    parts_sent: int = 0
+
+
+class JobStore(ABC):
+    """
+    Shared state for coordinating several worker processes on one mailbox.
+    Subclass this to back the coordination with something other than SQLite.
+    """
+
+    @abstractmethod
+    def has_job(self, msg_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    def enqueue_job(self, msg_id: str, device_key: str, msg_text: str,
+                    reply_url: Optional[str], received_at: float) -> bool:
+        ...
+
+    @abstractmethod
+    def mark_done(self, msg_ids: Iterable[str]) -> None:
+        ...
+
+    @abstractmethod
+    def mark_failed(self, msg_id: str, error: str) -> None:
+        ...
+
+    @abstractmethod
+    def finished_message_ids(self) -> Set[str]:
+        ...
+
+    @abstractmethod
+    def claim_job(self, worker_id: str, lease_seconds: float) -> Optional[Job]:
+        ...
+
+    @abstractmethod
+    def renew_lease(self, msg_id: str, worker_id: str, lease_seconds: float) -> bool:
+        ...
+
+    @abstractmethod
+    def update_progress(self, msg_id: str, worker_id: str, **fields) -> bool:
+        ...
+
+    @abstractmethod
+    def complete_job(self, msg_id: str, worker_id: str) -> None:
+        ...
+
+    @abstractmethod
+    def release_job(self, msg_id: str, worker_id: str, error: str) -> None:
+        ...
+
+    @abstractmethod
+    def try_acquire_lock(self, name: str, owner: str, ttl_seconds: float) -> bool:
+        ...
+
+    @abstractmethod
+    def renew_lock(self, name: str, owner: str, ttl_seconds: float) -> bool:
+        ...
+
+    @abstractmethod
+    def release_lock(self, name: str, owner: str) -> None:
+        ...
+
+    @abstractmethod
+    def reserve_send_slot(self, interval_seconds: float) -> float:
+        ...
+
+    @abstractmethod
+    def claim_once(self, key: str, owner: str) -> bool:
+        ...
+
+
+class SQLiteJobStore(JobStore):
+    """
+    JobStore backed by a SQLite file in WAL mode. Every worker on the host opens
+    the same file; writes that need to be atomic run under BEGIN IMMEDIATE.
+    WAL needs shared memory between processes, so all workers must run on one
+    host (not over a network filesystem).
+    """
+
+    def __init__(self, path: str, max_attempts: int = 3, busy_timeout: float = 30.0):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.busy_timeout = busy_timeout
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    msg_id TEXT PRIMARY KEY,
+                    device_key TEXT NOT NULL,
+                    msg_text TEXT NOT NULL,
+                    reply_url TEXT,
+                    received_at REAL NOT NULL,
+                    status TEXT NOT NULL,
+                    lease_owner TEXT,
+                    lease_expires REAL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    updated_at REAL NOT NULL,
+                    saildocs_sent_at REAL,
+                    saildocs_reply_id TEXT,
+                    outbox TEXT,
+                    parts_sent INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS jobs_status_received
+                    ON jobs (status, received_at);
+                CREATE TABLE IF NOT EXISTS locks (
+                    name TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    expires REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS claims (
+                    key TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    claimed_at REAL NOT NULL
+                );
+                """
+            )
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, ddl in (
+                ("saildocs_sent_at", "REAL"),
+                ("saildocs_reply_id", "TEXT"),
+                ("outbox", "TEXT"),
+                ("parts_sent", "INTEGER NOT NULL DEFAULT 0"),
+            ):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {ddl}")
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        # A fresh connection per call keeps the store safe to use from the
+        # lease heartbeat thread as well as the worker loop.
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def has_job(self, msg_id: str) -> bool:
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT 1 FROM jobs WHERE msg_id = ?", (msg_id,)).fetchone()
+            return row is not None
+        finally:
+            conn.close()
+
+    def enqueue_job(self, msg_id: str, device_key: str, msg_text: str,
+                    reply_url: Optional[str], received_at: float) -> bool:
+        """Add a pending job. Returns False if another worker already queued it."""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO jobs "
+                "(msg_id, device_key, msg_text, reply_url, received_at, status, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (msg_id, device_key, msg_text, reply_url, received_at, STATUS_PENDING, time.time()),
+            )
+            return cursor.rowcount == 1
+
+    def mark_done(self, msg_ids: Iterable[str]) -> None:
+        """Record messages handled outside the store (e.g. the legacy processed file)."""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO jobs "
+                "(msg_id, device_key, msg_text, received_at, status, updated_at) "
+                "VALUES (?, ?, '', 0, ?, ?)",
+                [(msg_id, msg_id, STATUS_DONE, now) for msg_id in msg_ids],
+            )
+
+    def mark_failed(self, msg_id: str, error: str) -> None:
+        """Record a message that cannot be processed so it is not fetched again."""
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO jobs "
+                "(msg_id, device_key, msg_text, received_at, status, last_error, updated_at) "
+                "VALUES (?, ?, '', 0, ?, ?, ?)",
+                (msg_id, msg_id, STATUS_FAILED, error, time.time()),
+            )
+
+    def finished_message_ids(self) -> Set[str]:
+        """IDs of every message that is done or has failed for good."""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT msg_id FROM jobs WHERE status IN (?, ?)", (STATUS_DONE, STATUS_FAILED)
+            ).fetchall()
+            return {row["msg_id"] for row in rows}
+        finally:
+            conn.close()
+
+    def claim_job(self, worker_id: str, lease_seconds: float) -> Optional[Job]:
+        """
+        Lease the oldest claimable job. A job is claimable when it is pending or its
+        lease has expired, and no other job for the same device is currently leased,
+        so replies to one device are never interleaved.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, lease_owner = NULL, lease_expires = NULL, "
+                "last_error = COALESCE(last_error, 'max attempts exceeded'), updated_at = ? "
+                "WHERE attempts >= ? AND (status = ? OR (status = ? AND lease_expires < ?))",
+                (STATUS_FAILED, now, self.max_attempts, STATUS_PENDING, STATUS_LEASED, now),
+            )
+            row = conn.execute(
+                "SELECT * FROM jobs AS j "
+                "WHERE (j.status = ? OR (j.status = ? AND j.lease_expires < ?)) "
+                "AND NOT EXISTS ("
+                "  SELECT 1 FROM jobs AS other "
+                "  WHERE other.device_key = j.device_key AND other.msg_id != j.msg_id "
+                "  AND ((other.status = ? AND other.lease_expires >= ?) "
+                "       OR (other.status IN (?, ?) AND other.received_at < j.received_at))"
+                ") "
+                "ORDER BY j.received_at LIMIT 1",
+                (STATUS_PENDING, STATUS_LEASED, now,
+                 STATUS_LEASED, now, STATUS_PENDING, STATUS_LEASED),
+            ).fetchone()
+            if row is None:
+                return None
+            if row["status"] == STATUS_LEASED:
+                logger.warning("Reclaiming job %s from expired lease held by %s.",
+                               row["msg_id"], row["lease_owner"])
+            conn.execute(
+                "UPDATE jobs SET status = ?, lease_owner = ?, lease_expires = ?, "
+                "attempts = attempts + 1, updated_at = ? WHERE msg_id = ?",
+                (STATUS_LEASED, worker_id, now + lease_seconds, now, row["msg_id"]),
+            )
+            return Job(
+                msg_id=row["msg_id"],
+                device_key=row["device_key"],
+                msg_text=row["msg_text"],
+                reply_url=row["reply_url"],
+                attempts=row["attempts"] + 1,
+                saildocs_sent_at=row["saildocs_sent_at"],
+                saildocs_reply_id=row["saildocs_reply_id"],
+                outbox=row["outbox"],
+                parts_sent=row["parts_sent"],
+            )
+
+    def renew_lease(self, msg_id: str, worker_id: str, lease_seconds: float) -> bool:
+        """Extend a lease still held by worker_id. Returns False if it was lost."""
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_expires = ?, updated_at = ? "
+                "WHERE msg_id = ? AND status = ? AND lease_owner = ? AND lease_expires >= ?",
+                (now + lease_seconds, now, msg_id, STATUS_LEASED, worker_id, now),
+            )
+            return cursor.rowcount == 1
+
+    def update_progress(self, msg_id: str, worker_id: str, **fields) -> bool:
+        """
+        Save progress on a job leased by worker_id (see PROGRESS_FIELDS).
+        Returns False if the lease was lost, in which case nothing is written.
+        """
+        unknown = set(fields) - set(PROGRESS_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown progress fields: {sorted(unknown)}")
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                f"UPDATE jobs SET {assignments}, updated_at = ? "
+                "WHERE msg_id = ? AND status = ? AND lease_owner = ? AND lease_expires >= ?",
+                (*fields.values(), now, msg_id, STATUS_LEASED, worker_id, now),
+            )
+            return cursor.rowcount == 1
+
+    def complete_job(self, msg_id: str, worker_id: str) -> None:
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, lease_owner = NULL, lease_expires = NULL, "
+                "updated_at = ? WHERE msg_id = ? AND lease_owner = ?",
+                (STATUS_DONE, time.time(), msg_id, worker_id),
+            )
+            if cursor.rowcount != 1:
+                logger.warning("Completed job %s after its lease was lost.", msg_id)
+
+    def release_job(self, msg_id: str, worker_id: str, error: str) -> None:
+        """Hand a failed job back for retry, or fail it once attempts run out."""
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, "
+                "lease_owner = NULL, lease_expires = NULL, last_error = ?, updated_at = ? "
+                "WHERE msg_id = ? AND lease_owner = ?",
+                (self.max_attempts, STATUS_FAILED, STATUS_PENDING, error, time.time(),
+                 msg_id, worker_id),
+            )
+
+    def try_acquire_lock(self, name: str, owner: str, ttl_seconds: float) -> bool:
+        """
+        Take a named lock for ttl_seconds if it is free or expired. Locks that are
+        never released early (like the Gmail poll lock) also space out work
+        across all workers.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "INSERT INTO locks (name, owner, expires) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, "
+                "expires = excluded.expires WHERE locks.expires <= ?",
+                (name, owner, now + ttl_seconds, now),
+            )
+            return cursor.rowcount == 1
+
+    def renew_lock(self, name: str, owner: str, ttl_seconds: float) -> bool:
+        """Extend a lock still held by owner. Returns False if it was lost."""
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE locks SET expires = ? WHERE name = ? AND owner = ? AND expires > ?",
+                (now + ttl_seconds, name, owner, now),
+            )
+            return cursor.rowcount == 1
+
+    def release_lock(self, name: str, owner: str) -> None:
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM locks WHERE name = ? AND owner = ?", (name, owner))
+
+    def reserve_send_slot(self, interval_seconds: float) -> float:
+        """
+        Reserve the next Garmin send slot shared by all workers and return the
+        time at which the caller may send.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute("SELECT expires FROM locks WHERE name = 'garmin_send'").fetchone()
+            slot = max(now, row["expires"]) if row else now
+            conn.execute(
+                "INSERT INTO locks (name, owner, expires) VALUES ('garmin_send', '', ?) "
+                "ON CONFLICT(name) DO UPDATE SET expires = excluded.expires",
+                (slot + interval_seconds,),
+            )
+            return slot
+
+    def claim_once(self, key: str, owner: str) -> bool:
+        """
+        Claim key for owner. Returns True if owner now holds it (including when it
+        already did), False if another owner claimed it first.
+        """
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO claims (key, owner, claimed_at) VALUES (?, ?, ?)",
+                (key, owner, time.time()),
+            )
+            row = conn.execute("SELECT owner FROM claims WHERE key = ?", (key,)).fetchone()
+            return row["owner"] == owner
@@ -3,8 +3,8 @@ import base64
 import zlib
 import logging
 import re
-from typing import Optional, Any
-from datetime import datetime
+from typing import Optional, Any, Callable
+from datetime import datetime, timezone
 from pathlib import Path
 
 import sys
@@ -56,28 +56,52 @@ def _send_to_saildocs(msg: str) -> None:
     """Send a GRIB request to SailDocs (implementation placeholder)."""
     logger.info(f"Sending to SailDocs: {msg}")
 
-def wait_for_saildocs_response(auth_service: Any, time_sent: datetime) -> Optional[dict]:
+def wait_for_saildocs_response(
+    auth_service: Any,
+    time_sent: datetime,
+    claim_response: Optional[Callable[[str], bool]] = None
+) -> Optional[dict]:
     """
     Wait for a Saildocs response email after a GRIB request.
     Returns the response dict if received, else None.
+    If claim_response is given (multi-worker mode), take the oldest response newer
+    than time_sent that claim_response(msg_id) accepts. Replies carry nothing that
+    ties them to a request, so callers must hold the shared Saildocs lock while
+    waiting; claim_response then only guards against a reply being reused.
     """
+    query = configs.SAILDOCS_RESPONSE_EMAIL
+    if claim_response is not None:
+        query += f" after:{int(time_sent.replace(tzinfo=timezone.utc).timestamp())}"
     for attempt in range(MAX_ATTEMPTS):
         time.sleep(SLEEP_SECONDS)
         try:
-            responses = email_func._search_gmail_messages(auth_service, configs.SAILDOCS_RESPONSE_EMAIL)
+            responses = email_func._search_gmail_messages(auth_service, query)
             if not responses:
                 continue
-            last_response = responses[0]
-            msg = auth_service.users().messages().get(userId='me', id=last_response['id']).execute()
-            headers = msg.get('payload', {}).get('headers', [])
-            date_header = next((h for h in headers if h['name'].lower() == 'date'), None)
-            if not date_header:
+            if claim_response is None:
+                last_response = responses[0]
+                if _received_after(auth_service, last_response['id'], time_sent):
+                    return last_response
                 continue
-            from email.utils import parsedate_to_datetime
-            time_received = parsedate_to_datetime(date_header['value'])
-            if time_received > time_sent:
-                return last_response
+            for response in reversed(responses):
+                if _received_after(auth_service, response['id'], time_sent) and claim_response(response['id']):
+                    return response
         except Exception as e:
             logger.warning(f"Attempt {attempt+1}: Could not check SailDocs response: {e}")
     logger.error("Timed out waiting for SailDocs response.")
     return None
+
+def _received_after(auth_service: Any, msg_id: str, time_sent: datetime) -> bool:
+    """Return True if the message's Date header is later than time_sent (naive UTC)."""
+    msg = auth_service.users().messages().get(
+        userId='me', id=msg_id, format='metadata', metadataHeaders=['Date']
+    ).execute()
+    headers = msg.get('payload', {}).get('headers', [])
+    date_header = next((h for h in headers if h['name'].lower() == 'date'), None)
+    if not date_header:
+        return False
+    from email.utils import parsedate_to_datetime
+    time_received = parsedate_to_datetime(date_header['value'])
+    if time_received.tzinfo is not None:
+        time_received = time_received.astimezone(timezone.utc).replace(tzinfo=None)
+    return time_received > time_sent
@@ -0,0 +1,143 @@
+import time
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Iterator, Optional, Set
+
+from src import configs
+from src.inreach_functions import SendGuard
+from src.job_store import Job, JobStore
+
+logger = logging.getLogger(__name__)
+
+SAILDOCS_LOCK = "saildocs"
+LOCK_RETRY_SECONDS = 5
+
+class LeaseLostError(RuntimeError):
+    """Raised when a worker no longer holds the lease on the job it is running."""
+
+class JobLease:
+    """
+    Keeps the lease on a claimed job (and any shared locks taken for it) alive
+    from a heartbeat thread, and records progress only while the lease is held.
+    Once the lease is lost, `lost` is set and the job must stop sending.
+    """
+
+    def __init__(self, store: JobStore, job: Job, worker_id: str):
+        self.store = store
+        self.job = job
+        self.worker_id = worker_id
+        self.lost = threading.Event()
+        self.held_locks: Set[str] = set()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._heartbeat, daemon=True)
+
+    def __enter__(self) -> "JobLease":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _heartbeat(self) -> None:
+        while not self._stop.wait(configs.JOB_HEARTBEAT_SECONDS):
+            try:
+                if not self.store.renew_lease(self.job.msg_id, self.worker_id, configs.JOB_LEASE_SECONDS):
+                    logger.warning("Lost lease on job %s; stopping it.", self.job.msg_id)
+                    self.lost.set()
+                    return
+                for name in list(self.held_locks):
+                    if not self.store.renew_lock(name, self.worker_id, configs.JOB_LEASE_SECONDS):
+                        logger.warning("Lost %s lock while running job %s; stopping it.", name, self.job.msg_id)
+                        self.lost.set()
+                        return
+            except sqlite3.OperationalError as e:
+                # Usually "database is locked"; the lease outlives a few missed beats.
+                logger.warning("Heartbeat for job %s failed, retrying: %s", self.job.msg_id, e)
+
+    def update_progress(self, **fields) -> None:
+        """Save progress on the job, or raise LeaseLostError if the lease is gone."""
+        if self.lost.is_set() or not self.store.update_progress(self.job.msg_id, self.worker_id, **fields):
+            self.lost.set()
+            raise LeaseLostError(f"Lease on job {self.job.msg_id} was lost.")
+        for name, value in fields.items():
+            setattr(self.job, name, value)
+
+    @contextmanager
+    def lock(self, name: str) -> Iterator[None]:
+        """Wait for a shared lock and hold it (renewed by the heartbeat) for the block."""
+        while not self.store.try_acquire_lock(name, self.worker_id, configs.JOB_LEASE_SECONDS):
+            if self.lost.wait(LOCK_RETRY_SECONDS):
+                raise LeaseLostError(f"Lease on job {self.job.msg_id} was lost.")
+        self.held_locks.add(name)
+        try:
+            yield
+        finally:
+            self.held_locks.discard(name)
+            self.store.release_lock(name, self.worker_id)
+
+class SaildocsExchange:
+    """
+    The Saildocs round trip of one GRIB job, as used by
+    email_functions.request_and_process_saildocs_grib. Saildocs replies carry
+    nothing that reliably ties them to a request, so the round trip runs under a
+    shared lock: one request in flight across all workers.
+    """
+
+    def __init__(self, lease: JobLease):
+        self.lease = lease
+
+    @property
+    def reply_id(self) -> Optional[str]:
+        return self.lease.job.saildocs_reply_id
+
+    @property
+    def sent_at(self) -> Optional[datetime]:
+        sent_at = self.lease.job.saildocs_sent_at
+        if sent_at is None:
+            return None
+        return datetime.fromtimestamp(sent_at, timezone.utc).replace(tzinfo=None)
+
+    def lock(self):
+        return self.lease.lock(SAILDOCS_LOCK)
+
+    def record_sent(self, time_sent: datetime) -> None:
+        self.lease.update_progress(saildocs_sent_at=time_sent.replace(tzinfo=timezone.utc).timestamp())
+
+    def record_reply(self, response_id: str) -> None:
+        self.lease.update_progress(saildocs_reply_id=response_id)
+
+    def claim_response(self, response_id: str) -> bool:
+        if self.lease.lost.is_set():
+            return False
+        return self.lease.store.claim_once(f"saildocs:{response_id}", self.lease.job.msg_id)
+
+class JobSendGuard(SendGuard):
+    """
+    SendGuard for a leased job: spaces parts on the shared Garmin send slot,
+    records each part sent so a retry resumes where it stopped, and stops as soon
+    as the lease is lost.
+    """
+
+    def __init__(self, lease: JobLease):
+        self.lease = lease
+
+    def begin(self, message: str, total_parts: int) -> int:
+        job = self.lease.job
+        if job.outbox == message:
+            return min(job.parts_sent, total_parts)
+        self.lease.update_progress(outbox=message, parts_sent=0)
+        return 0
+
+    def before_part(self, idx: int) -> bool:
+        if self.lease.lost.is_set():
+            return False
+        slot = self.lease.store.reserve_send_slot(configs.DELAY_BETWEEN_MESSAGES)
+        time.sleep(max(0.0, slot - time.time()))
+        return not self.lease.lost.is_set()
+
+    def after_part(self, idx: int) -> None:
+        self.lease.update_progress(parts_sent=idx + 1)
@@ -0,0 +1,141 @@
+import time
+
+import pytest
+
+from src.job_store import JobStore, SQLiteJobStore, STATUS_DONE, STATUS_FAILED
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SQLiteJobStore(str(tmp_path / "jobs.sqlite3"), max_attempts=2)
+
+
+def _status(store, msg_id):
+    conn = store._connect()
+    try:
+        return conn.execute("SELECT status FROM jobs WHERE msg_id = ?", (msg_id,)).fetchone()["status"]
+    finally:
+        conn.close()
+
+
+def test_incomplete_backend_fails_on_creation():
+    class PartialStore(JobStore):
+        def has_job(self, msg_id):
+            return False
+
+    with pytest.raises(TypeError):
+        PartialStore()
+
+
+def test_enqueue_is_deduplicated(store):
+    assert store.enqueue_job("m1", "boat", "text", None, 1.0)
+    assert not store.enqueue_job("m1", "boat", "text", None, 1.0)
+    assert store.has_job("m1")
+
+
+def test_claim_job_runs_oldest_first_and_one_per_device(store):
+    store.enqueue_job("b2", "boat-b", "text", None, 4.0)
+    store.enqueue_job("a2", "boat-a", "text", None, 3.0)
+    store.enqueue_job("a1", "boat-a", "text", None, 1.0)
+    store.enqueue_job("b1", "boat-b", "text", None, 2.0)
+
+    assert store.claim_job("w1", 60).msg_id == "a1"
+    assert store.claim_job("w2", 60).msg_id == "b1"
+    # a2 and b2 wait until their device's earlier job is finished.
+    assert store.claim_job("w3", 60) is None
+
+    store.complete_job("a1", "w1")
+    assert store.claim_job("w3", 60).msg_id == "a2"
+    assert store.claim_job("w4", 60) is None
+
+
+def test_expired_lease_is_reclaimed(store):
+    store.enqueue_job("m1", "boat", "text", None, 1.0)
+    first = store.claim_job("w1", 0.05)
+    assert first.attempts == 1
+    assert store.claim_job("w2", 60) is None
+
+    time.sleep(0.1)
+    second = store.claim_job("w2", 60)
+    assert second.msg_id == "m1"
+    assert second.attempts == 2
+    assert not store.renew_lease("m1", "w1", 60)
+    assert store.renew_lease("m1", "w2", 60)
+
+
+def test_progress_survives_reclaim_and_needs_the_lease(store):
+    store.enqueue_job("m1", "boat", "text", None, 1.0)
+    store.claim_job("w1", 0.05)
+    assert store.update_progress("m1", "w1", outbox="hello", parts_sent=2)
+
+    time.sleep(0.1)
+    assert not store.update_progress("m1", "w1", parts_sent=3)
+    job = store.claim_job("w2", 60)
+    assert (job.outbox, job.parts_sent) == ("hello", 2)
+
+    with pytest.raises(ValueError):
+        store.update_progress("m1", "w2", status=STATUS_DONE)
+
+
+def test_release_job_fails_at_max_attempts(store):
+    store.enqueue_job("m1", "boat", "text", None, 1.0)
+    store.claim_job("w1", 60)
+    store.release_job("m1", "w1", "boom")
+    assert store.claim_job("w1", 60).attempts == 2
+    store.release_job("m1", "w1", "boom")
+
+    assert _status(store, "m1") == STATUS_FAILED
+    assert store.claim_job("w1", 60) is None
+
+
+def test_expired_lease_fails_at_max_attempts(store):
+    store.enqueue_job("m1", "boat", "text", None, 1.0)
+    store.claim_job("w1", 0.01)
+    time.sleep(0.05)
+    store.claim_job("w2", 0.01)
+    time.sleep(0.05)
+
+    assert store.claim_job("w3", 60) is None
+    assert _status(store, "m1") == STATUS_FAILED
+
+
+def test_finished_message_ids(store):
+    store.mark_done(["old"])
+    store.mark_failed("broken", "no message text")
+    store.enqueue_job("new", "boat", "text", None, 1.0)
+    assert store.finished_message_ids() == {"old", "broken"}
+
+
+def test_try_acquire_lock_until_expiry(store):
+    assert store.try_acquire_lock("gmail_poll", "w1", 0.05)
+    assert not store.try_acquire_lock("gmail_poll", "w2", 0.05)
+    assert not store.try_acquire_lock("gmail_poll", "w1", 0.05)
+
+    time.sleep(0.1)
+    assert store.try_acquire_lock("gmail_poll", "w2", 60)
+
+
+def test_renew_and_release_lock(store):
+    assert store.try_acquire_lock("saildocs", "w1", 60)
+    assert store.renew_lock("saildocs", "w1", 60)
+    assert not store.renew_lock("saildocs", "w2", 60)
+
+    store.release_lock("saildocs", "w2")
+    assert not store.try_acquire_lock("saildocs", "w2", 60)
+    store.release_lock("saildocs", "w1")
+    assert store.try_acquire_lock("saildocs", "w2", 60)
+
+
+def test_reserve_send_slot_spacing(store):
+    start = time.time()
+    slots = [store.reserve_send_slot(5) for _ in range(3)]
+    assert slots[0] == pytest.approx(start, abs=1)
+    assert slots[1] - slots[0] == pytest.approx(5)
+    assert slots[2] - slots[1] == pytest.approx(5)
+
+
+def test_claim_once(store):
+    assert store.claim_once("saildocs:r1", "job-1")
+    assert store.claim_once("saildocs:r1", "job-1")
+    assert not store.claim_once("saildocs:r1", "job-2")
+    assert store.claim_once("saildocs:r2", "job-2")